@@ -0,0 +1,377 @@
+"""
+Offline benchmark suite for the catalogue pipeline
+
+Times each stage (parsing, grouping, epoch selection, propagation and
+rendering) on synthetic catalogues of several sizes, and appends the
+results to a history file so that regressions can be tracked over time.
+"""
+
+from tle import (
+    TLE,
+    groupTLEs,
+    getEpochCat,
+    getTimescale,
+    getObserver,
+    SITE_LATITUDE,
+    SITE_LONGITUDE,
+    SITE_ELEVATION,
+    )
+from reduction import (
+    batchTopocentric,
+    getKernel,
+    _skyfieldTopocentric,
+    )
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
+    )
+from synthCat import (
+    generateCat,
+    DEFAULT_MIX,
+    )
+import io
+import os
+import json
+import time
+import platform
+import subprocess
+import argparse as ap
+from contextlib import redirect_stdout
+from datetime import (
+    datetime,
+    timezone,
+    )
+
+STAGES = ['parse', 'group', 'epoch', 'propagate', 'reduce', 'render']
+
+CAT_START = datetime(2018, 5, 1)
+CAT_END = datetime(2018, 5, 8)
+EPOCH = datetime(2018, 5, 4, 22)
+
+VALIDATE_SIZE = 500     # objects compared against skyfield
+VALIDATE_STEPS = 20     # times across the night, 30 min apart
+VALIDATE_TOL = 0.01     # arcsec, on ra, dec, ha and alt
+
+def argParse():
+    """
+    Argument parser settings
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    args : array-like
+        Array of command line arguments
+    """
+    parser = ap.ArgumentParser()
+    
+    parser.add_argument('--sizes',
+                        help='catalogue sizes [objects], '
+                             'default 1000 10000 100000',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 10000, 100000])
+    
+    parser.add_argument('--stages',
+                        help='stages to benchmark, default all; '
+                             '{}'.format(', '.join(STAGES)),
+                        type=str,
+                        nargs='+',
+                        default=STAGES)
+    
+    parser.add_argument('--mix',
+                        help='orbit mix for the synthetic catalogue, '
+                             'default "{}"'.format(DEFAULT_MIX),
+                        type=str,
+                        default=DEFAULT_MIX)
+    
+    parser.add_argument('--repeat',
+                        help='number of repeats (best taken), default 3',
+                        type=int,
+                        default=3)
+    
+    parser.add_argument('--validate',
+                        help='check the reduction kernel against skyfield '
+                             'before benchmarking',
+                        action='store_true')
+    
+    parser.add_argument('--history',
+                        help='file to which results are appended, '
+                             'default bench_history.jsonl',
+                        type=str,
+                        default='bench_history.jsonl')
+    
+    addProfilingArgs(parser)
+    
+    return parser.parse_args()
+
+def timeStage(func, repeat):
+    """
+    Best wall-clock time of a function over a number of repeats, with
+    its terminal output discarded
+    
+    Parameters
+    ----------
+    func : callable
+        Function to time, taking no arguments
+    repeat : int
+        Number of repeats
+    
+    Returns
+    -------
+    best : float
+        Fastest run [s]
+    """
+    best = None
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    
+    return best
+
+def benchParse(cat):
+    """
+    Parse every element set, as TLE.__init__
+    """
+    return [TLE(cat[i+1], cat[i+2], name=cat[i])
+            for i in range(0, len(cat), 3)]
+
+def benchPropagate(epoch_cat):
+    """
+    Propagate every object to a single epoch, as TLE.radec
+    """
+    from skyfield.api import utc
+    
+    epoch = EPOCH.replace(tzinfo=utc)
+    for norad_id in epoch_cat:
+        TLE(epoch_cat[norad_id][0], epoch_cat[norad_id][1]).radec(epoch)
+
+def benchReduce(epoch_cat):
+    """
+    Propagate every object to a single epoch, as batchTopocentric
+    """
+    from skyfield.api import utc
+    
+    epoch = EPOCH.replace(tzinfo=utc)
+    tles = [TLE(epoch_cat[norad_id][0], epoch_cat[norad_id][1])
+            for norad_id in epoch_cat]
+    batchTopocentric(tles, getObserver(), 
+                     getTimescale().from_datetimes([epoch]))
+
+def benchRender(epoch_cat):
+    """
+    Render a single frame of the plotGEO loop (without display)
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from astropy.time import Time
+    from astropy import units as u
+    from astropy.coordinates import EarthLocation
+    from skyfield.api import utc
+    
+    epoch = EPOCH.replace(tzinfo=utc)
+    location = EarthLocation(lat=SITE_LATITUDE*u.deg,
+                             lon=SITE_LONGITUDE*u.deg,
+                             height=SITE_ELEVATION*u.m)
+    lst = Time(epoch, scale='utc',
+               location=location).sidereal_time('apparent')
+    
+    tles = [TLE(epoch_cat[norad_id][0], epoch_cat[norad_id][1])
+            for norad_id in epoch_cat]
+    coords = batchTopocentric(tles, 
+                              getObserver(),
+                              getTimescale().from_datetimes([epoch]))
+    ha_list = (lst.hourangle - coords['ra'][:, 0] + 12) % 24 - 12
+    dec_list = coords['dec'][:, 0]
+    
+    fig = plt.figure(figsize=(10, 6))
+    plt.plot(ha_list, dec_list, 'c.', ms=3)
+    plt.xlim(-12, 12)
+    plt.ylim(-33, 33)
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+
+def validateReduction(mix=DEFAULT_MIX):
+    """
+    Compare the fused reduction kernel against skyfield's frame 
+    machinery over a night, on a synthetic catalogue
+    
+    Parameters
+    ----------
+    mix : str, optional
+        Orbit mix for the synthetic catalogue
+        Default = DEFAULT_MIX
+    
+    Returns
+    -------
+    errors : dict or None
+        Largest difference in 'ra', 'dec', 'ha', 'alt' [arcsec] and 
+        'range' [km], or None if Numba is unavailable
+    """
+    import numpy as np
+    
+    if getKernel() is None:
+        return None
+    
+    cat = generateCat(VALIDATE_SIZE, CAT_START, CAT_END, n_sets=1, 
+                      mix=mix)
+    tles = [TLE(cat[i+1], cat[i+2]) for i in range(0, len(cat), 3)]
+    times = getTimescale().utc(EPOCH.year,
+                               EPOCH.month,
+                               EPOCH.day,
+                               EPOCH.hour,
+                               30 * np.arange(VALIDATE_STEPS))
+    
+    kernel = batchTopocentric(tles, getObserver(), times)
+    skyfield = _skyfieldTopocentric(tles, getObserver(), times)
+    
+    # ra and ha in hours, wrapped; dec and alt in degrees
+    scales = {'ra':(54000., 24.), 'ha':(54000., 24.),
+              'dec':(3600., None), 'alt':(3600., None),
+              'range':(1., None)}
+    errors = {}
+    for column in scales:
+        diff = kernel[column] - skyfield[column]
+        scale, wrap = scales[column]
+        if wrap is not None:
+            diff = (diff + wrap / 2.) % wrap - wrap / 2.
+        errors.update({column:float(np.nanmax(abs(diff)) * scale)})
+    
+    return errors
+
+def runBenchmarks(sizes, stages, mix=DEFAULT_MIX, repeat=3):
+    """
+    Time the requested stages on synthetic catalogues
+    
+    Parameters
+    ----------
+    sizes : array-like
+        Catalogue sizes [objects]
+    stages : array-like
+        Stages to benchmark, from STAGES
+    mix : str, optional
+        Orbit mix for the synthetic catalogue
+        Default = DEFAULT_MIX
+    repeat : int, optional
+        Number of repeats (best taken)
+        Default = 3
+    
+    Returns
+    -------
+    results : dict
+        Timings [s] keyed by stage, then by size
+    """
+    results = {stage:{} for stage in stages}
+    
+    for size in sizes:
+        cat = generateCat(size, CAT_START, CAT_END, mix=mix)
+        
+        # inputs needed by the later stages, built untimed
+        with redirect_stdout(io.StringIO()):
+            tles = benchParse(cat)
+            run_cat = json.loads(json.dumps(groupTLEs(tles)))
+            epoch_cat = getEpochCat(run_cat, EPOCH)
+        
+        timers = {'parse':lambda: benchParse(cat),
+                  'group':lambda: groupTLEs(tles),
+                  'epoch':lambda: getEpochCat(run_cat, EPOCH),
+                  'propagate':lambda: benchPropagate(epoch_cat),
+                  'reduce':lambda: benchReduce(epoch_cat),
+                  'render':lambda: benchRender(epoch_cat)}
+        
+        for stage in stages:
+            best = timeStage(timers[stage], repeat)
+            results[stage].update({str(size):best})
+            print('{:>10} {:>8} objects: {:10.4f} s'.format(stage,
+                                                           str(size),
+                                                           best))
+    
+    return results
+
+def getRevision():
+    """
+    Current git revision of the repository, if available
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compareHistory(results, history):
+    """
+    Print the change in each timing relative to the last recorded run
+    """
+    try:
+        with open(history, 'r') as f:
+            last = json.loads(f.readlines()[-1])['results']
+    except (IOError, OSError, IndexError, ValueError, KeyError):
+        return
+    
+    print('Change relative to last recorded run:')
+    for stage in results:
+        for size in results[stage]:
+            if size in last.get(stage, {}):
+                ratio = results[stage][size] / last[stage][size]
+                print('{:>10} {:>8} objects: {:8.2f}x'.format(stage,
+                                                             size,
+                                                             ratio))
+
+if __name__ == "__main__":
+    
+    args = argParse()
+    profiler = startProfiling(args)
+    
+    for stage in args.stages:
+        if stage not in STAGES:
+            print('Incorrect format! Please supply stages from: '
+                  '{}...'.format(', '.join(STAGES)))
+            quit()
+    
+    errors = None
+    if args.validate:
+        errors = validateReduction(args.mix)
+        if errors is None:
+            print('Numba not installed; skipping kernel validation')
+        else:
+            print('Kernel vs skyfield: ra {:.2e}", dec {:.2e}", '
+                  'ha {:.2e}", alt {:.2e}", range {:.2e} km'.format(
+                      errors['ra'],
+                      errors['dec'],
+                      errors['ha'],
+                      errors['alt'],
+                      errors['range']))
+            if max(errors[column] for column in 
+                   ['ra', 'dec', 'ha', 'alt']) > VALIDATE_TOL:
+                print('Kernel differs from skyfield by more than '
+                      '{}". Quitting...'.format(str(VALIDATE_TOL)))
+                quit(1)
+    
+    results = runBenchmarks(args.sizes,
+                            args.stages,
+                            args.mix,
+                            args.repeat)
+    
+    compareHistory(results, args.history)
+    
+    record = {'date':datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S'),
+              'revision':getRevision(),
+              'python':platform.python_version(),
+              'mix':args.mix,
+              'validate':errors,
+              'results':results}
+    
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    
+    stopProfiling(args, profiler)
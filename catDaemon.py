@@ -0,0 +1,483 @@
+"""
+Long-running catalogue query daemon
+
+Loads a run catalogue once, keeping the parsed elements and propagation
+state in memory, and answers queries over a local Unix socket. Each
+request and response is a single line of JSON, e.g.
+
+    {"cmd": "epoch", "epoch": "2018-05-01T22:00:00"}
+    {"cmd": "radec", "ids": ["25544"], "times": ["2018-05-01T22:00:00"]}
+    {"cmd": "reload"}
+    {"cmd": "ping"}
+
+The run catalogue is reloaded automatically when its file changes (e.g.
+when a new pull lands), and element sets merged with updateCat are
+picked up incrementally from the update journal.
+"""
+
+from tle import (
+    TLE,
+    getFractionalYearDay,
+    insertElsets,
+    loadRunCat,
+    getUpdatePath,
+    getTimescale,
+    getObserver,
+    )
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
+    stage,
+    count,
+    )
+import os
+import copy
+import json
+import time
+import socket
+import threading
+import argparse as ap
+import socketserver
+from operator import itemgetter
+from datetime import datetime
+
+try:
+    FileNotFoundError
+except NameError:
+    FileNotFoundError = IOError
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+class RunCatalogue:
+    """
+    In-memory run catalogue, with parsed elements per norad id
+    """
+    def __init__(self, run_path):
+        """
+        Load and parse a run catalogue json file
+        
+        Parameters
+        ----------
+        run_path : str
+            Path to run catalogue json file
+        """
+        self.path = run_path
+        self.update_path = getUpdatePath(run_path)
+        self.mtime = os.path.getmtime(run_path)
+        
+        # journal lines replayed twice are harmless, lines missed are not
+        self.offset, self.inode = self.journalStat()
+        self.run_cat = loadRunCat(run_path)
+        
+        self.tles = {}
+        for norad_id in self.run_cat:
+            self.tles.update({norad_id:[TLE(tle[0], tle[1])
+                                        for tle in self.run_cat[norad_id]]})
+    
+    def journalStat(self):
+        """
+        Current size [bytes] and inode of the update journal
+        """
+        try:
+            stat = os.stat(self.update_path)
+        except OSError:
+            return 0, None
+        
+        return stat.st_size, stat.st_ino
+    
+    def withUpdates(self):
+        """
+        Apply any new lines of the update journal
+        
+        Only the objects named in the journal are re-indexed; everything
+        else is shared with this catalogue, which is left untouched for
+        clients still using it.
+        
+        Returns
+        -------
+        cat : RunCatalogue object or None
+            Updated catalogue, or None if there are no new updates
+        """
+        size, inode = self.journalStat()
+        
+        # journal compacted away or recreated; replay the new one whole
+        offset = self.offset
+        if size < offset or inode != self.inode:
+            offset = 0
+        if size <= offset:
+            return None
+        
+        with open(self.update_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        
+        # leave any partially written line for the next poll
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return None
+        
+        cat = copy.copy(self)
+        cat.offset = offset + len(data)
+        cat.inode = inode
+        cat.run_cat = dict(self.run_cat)
+        cat.tles = dict(self.tles)
+        
+        for line in data.decode().splitlines():
+            if not line.strip():
+                continue
+            try:
+                elsets = json.loads(line)
+            except ValueError:
+                # skip rather than stall every later update behind it
+                print('Skipping malformed journal line: {}'.format(
+                    line[:80]))
+                continue
+            for norad_id in elsets:
+                cat.run_cat[norad_id] = list(cat.run_cat.get(norad_id, []))
+            added = insertElsets(cat.run_cat, elsets)
+            
+            for norad_id in added:
+                parsed = {t.line1:t for t in cat.tles.get(norad_id, [])}
+                cat.tles[norad_id] = [parsed.get(tle[0]) or
+                                      TLE(tle[0], tle[1])
+                                      for tle in cat.run_cat[norad_id]]
+        
+        return cat
+    
+    def getClosestIndex(self, norad_id, epoch_yday):
+        """
+        Index of the tle closest to a given year day for a norad id
+        """
+        t_diff = [abs(epoch_yday - t.yday) for t in self.tles[norad_id]]
+        
+        return min(enumerate(t_diff), key=itemgetter(1))[0]
+    
+    def epochCat(self, epoch):
+        """
+        Obtain appropriate catalogue for a desired epoch
+        
+        Parameters
+        ----------
+        epoch : datetime object
+            Desired epoch to compare tles against
+        
+        Returns
+        -------
+        epoch_cat : dict
+            Catalogue of tles for desired epoch
+        """
+        epoch_yday = getFractionalYearDay(epoch)
+        
+        epoch_cat = {}
+        for norad_id in self.tles:
+            idx = self.getClosestIndex(norad_id, epoch_yday)
+            epoch_cat.update({norad_id:self.run_cat[norad_id][idx]})
+        
+        return epoch_cat
+    
+    def radec(self, norad_ids, epochs):
+        """
+        Determine radec coords of objects at a series of epochs, using
+        the closest tle to each epoch
+        
+        Parameters
+        ----------
+        norad_ids : array-like
+            Norad ids of the objects of interest
+        epochs : array-like
+            List of datetime objects (utc)
+        
+        Returns
+        -------
+        radec : dict
+            Lists of [ra, dec] pairs [hours, degrees] for each norad
+            id, in the order of the given epochs
+        """
+        import numpy as np
+        from reduction import batchTopocentric
+        
+        epoch_ydays = [getFractionalYearDay(epoch) for epoch in epochs]
+        if epochs:
+            times = getTimescale().from_datetimes(epochs)
+        
+        radec = {}
+        for norad_id in norad_ids:
+            if norad_id not in self.tles:
+                radec.update({norad_id:None})
+                continue
+            
+            # group the epochs by closest tle, reducing each tle once
+            groups = {}
+            for n, epoch_yday in enumerate(epoch_ydays):
+                idx = self.getClosestIndex(norad_id, epoch_yday)
+                groups.setdefault(idx, []).append(n)
+            
+            coords = [None] * len(epochs)
+            for idx in groups:
+                columns = np.array(groups[idx])
+                rows = batchTopocentric([self.tles[norad_id][idx]],
+                                        getObserver(),
+                                        times[columns])
+                for k, n in enumerate(columns):
+                    coords[n] = [float(rows['ra'][0, k]),
+                                 float(rows['dec'][0, k])]
+            
+            radec.update({norad_id:coords})
+        
+        return radec
+
+class CatalogueHandler(socketserver.StreamRequestHandler):
+    """
+    Answer line-delimited json requests from a single client
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode())
+                response = {'ok':True,
+                            'result':self.server.call(self.server.dispatch,
+                                                      request)}
+            except Exception as e:
+                response = {'ok':False, 'error':str(e)}
+            
+            self.wfile.write((json.dumps(response) + '\n').encode())
+            self.wfile.flush()
+
+class CatalogueServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    """
+    Threaded Unix socket server holding a run catalogue in memory
+    """
+    daemon_threads = True
+    profiler = None # ThreadProfiler, if requested
+    
+    def __init__(self, socket_path, run_path, poll=10.):
+        """
+        Initiate server and load the run catalogue
+        
+        Parameters
+        ----------
+        socket_path : str
+            Path of the Unix socket to listen on
+        run_path : str
+            Path to run catalogue json file
+        poll : float, optional
+            Interval [s] at which to check the catalogue for changes
+            Default = 10.
+        """
+        self.cat = RunCatalogue(run_path)
+        self.lock = threading.Lock()
+        self.poll = poll
+        
+        # only clear a stale socket, never one a live daemon is using
+        if os.path.exists(socket_path):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(socket_path)
+            except OSError:
+                os.remove(socket_path)
+            else:
+                raise RuntimeError('Daemon already listening on '
+                                   '{}'.format(socket_path))
+            finally:
+                sock.close()
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               CatalogueHandler)
+        
+        watcher = threading.Thread(target=self.watch)
+        watcher.daemon = True
+        watcher.start()
+    
+    def reload(self, force=False):
+        """
+        Reload the run catalogue if its file has changed, or apply any
+        new journalled updates
+        
+        The new catalogue is parsed before being swapped in, so clients
+        are served from the old one in the meantime.
+        """
+        with self.lock:
+            try:
+                mtime = os.path.getmtime(self.cat.path)
+            except OSError:
+                return False # mid-write; try again on next poll
+            
+            if not force and mtime == self.cat.mtime:
+                try:
+                    cat = self.cat.withUpdates()
+                except (OSError, ValueError) as e:
+                    print('Failed to apply run catalogue updates: '
+                          '{}'.format(str(e)))
+                    return False
+                if cat is None:
+                    return False
+                self.cat = cat
+                print('Applied run catalogue updates ({} objects)'.format(
+                    str(len(self.cat.tles))))
+                return True
+            
+            try:
+                self.cat = RunCatalogue(self.cat.path)
+            except (OSError, ValueError) as e:
+                print('Failed to reload run catalogue: {}'.format(str(e)))
+                return False
+        
+        print('Reloaded run catalogue ({} objects)'.format(
+            str(len(self.cat.tles))))
+        
+        return True
+    
+    def watch(self):
+        """
+        Poll the run catalogue for changes
+        """
+        while True:
+            time.sleep(self.poll)
+            try:
+                self.call(self.reload)
+            except Exception as e:
+                # a failed poll must never stop the watcher
+                print('Failed to check run catalogue: {}'.format(str(e)))
+    
+    def call(self, func, *args):
+        """
+        Call a function, profiling it if a profiler is attached
+        """
+        if self.profiler is None:
+            return func(*args)
+        
+        with self.profiler.profile():
+            return func(*args)
+    
+    def dispatch(self, request):
+        """
+        Carry out a single client request
+        """
+        cat = self.cat # hold reference in case of reload
+        cmd = request.get('cmd')
+        
+        if cmd == 'ping':
+            return len(cat.tles)
+        elif cmd == 'reload':
+            return self.reload(force=True)
+        elif cmd == 'epoch':
+            epoch = datetime.strptime(request['epoch'], TIME_FORMAT)
+            with stage('epoch'):
+                epoch_cat = cat.epochCat(epoch)
+            count('epoch', len(epoch_cat))
+            return epoch_cat
+        elif cmd == 'radec':
+            from skyfield.api import utc
+            
+            epochs = [datetime.strptime(t, TIME_FORMAT).replace(tzinfo=utc)
+                      for t in request['times']]
+            with stage('propagate'):
+                radec = cat.radec([str(i) for i in request['ids']], epochs)
+            # unknown ids come back as None, unpropagated
+            count('propagate', len([norad_id for norad_id in radec
+                                    if radec[norad_id] is not None]) *
+                               len(epochs))
+            return radec
+        else:
+            raise ValueError('Unknown command: {}'.format(cmd))
+
+def queryDaemon(socket_path, request):
+    """
+    Send a single request to a running catalogue daemon
+    
+    Parameters
+    ----------
+    socket_path : str
+        Path of the Unix socket the daemon is listening on
+    request : dict
+        Request to send, e.g. {'cmd':'epoch',
+                               'epoch':'2018-05-01T22:00:00'}
+    
+    Returns
+    -------
+    result : object
+        Result of the request
+    
+    Raises
+    ------
+    RuntimeError
+        If the daemon reports an error
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        f = sock.makefile('rwb')
+        f.write((json.dumps(request) + '\n').encode())
+        f.flush()
+        response = json.loads(f.readline().decode())
+    finally:
+        sock.close()
+    
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    
+    return response['result']
+
+def argParse():
+    """
+    Argument parser settings
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    args : array-like
+        Array of command line arguments
+    """
+    parser = ap.ArgumentParser()
+    
+    parser.add_argument('run_path',
+                        help='path to run catalogue json file',
+                        type=str)
+    
+    parser.add_argument('socket_path',
+                        help='path of Unix socket to listen on',
+                        type=str)
+    
+    parser.add_argument('--poll',
+                        help='interval between checks for an updated '
+                             'run catalogue [seconds], default 10',
+                        type=float,
+                        default=10.)
+    
+    addProfilingArgs(parser)
+    
+    return parser.parse_args()
+
+if __name__ == "__main__":
+	
+	args = argParse()
+	# the work happens in handler threads, not this one
+	profiler = startProfiling(args, threads=True)
+	
+	try:
+		server = CatalogueServer(args.socket_path,
+		                         args.run_path,
+		                         args.poll)
+	except FileNotFoundError:
+		print('No run catalogue found. Quitting...')
+		quit()
+	except RuntimeError as e:
+		print('{}. Quitting...'.format(str(e)))
+		quit()
+	
+	server.profiler = profiler
+	
+	print('Serving {} objects on {}'.format(str(len(server.cat.tles)),
+	                                        args.socket_path))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		os.remove(args.socket_path)
+		stopProfiling(args, profiler)
@@ -5,8 +5,13 @@ Obtain appropriate TLE catalogue for a desired epoch
 from tle import (
     parseEpochInput,
     getEpochCat,
+    loadRunCat,
+    )
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
     )
-import json
 import argparse as ap
 
 try:
@@ -42,15 +47,17 @@ def argParse():
                         help='output directory for resulting catalogue',
                         type=str)
     
+    addProfilingArgs(parser)
+    
     return parser.parse_args()
 
 if __name__ == "__main__":
 	
 	args = argParse()
+	profiler = startProfiling(args)
 	
 	try:
-		with open(args.run_path, "r") as rc:
-			run_cat = json.load(rc)
+		run_cat = loadRunCat(args.run_path)
 	except FileNotFoundError:
 		print('No run catalogue found. Quitting...')
 		quit()
@@ -60,3 +67,5 @@ if __name__ == "__main__":
 	epoch_cat = getEpochCat(run_cat,
 	                        epoch,
 	                        args.out_dir)
+	
+	stopProfiling(args, profiler)
@@ -8,10 +8,23 @@ from tle import (
     parseRunInput,
     checkRunLength,
     organiseCat,
+    updateCat,
+    loadRunCat,
+    RUN_CAT_FILE,
+    )
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
     )
 import argparse as ap
 from datetime import timedelta
 
+try:
+    FileNotFoundError
+except NameError:
+    FileNotFoundError = IOError
+
 def argParse():
     """
     Argument parser settings
@@ -48,11 +61,19 @@ def argParse():
                         help='output directory for resulting catalog',
                         type=str)
     
+    parser.add_argument('--update',
+                        help='merge into the existing run catalogue in '
+                             'out_dir rather than rebuilding it',
+                        action='store_true')
+    
+    addProfilingArgs(parser)
+    
     return parser.parse_args()
 
 if __name__ == "__main__":
     
     args = argParse()
+    profiler = startProfiling(args)
     
     start, end = parseRunInput(args)
     
@@ -63,11 +84,25 @@ if __name__ == "__main__":
     # check length of run does not exceed limit for catalogue type
     dates = checkRunLength(start, end, args.cat_type)
     
+    # load existing catalogue before querying, if updating
+    if args.update:
+        try:
+            org_cat = loadRunCat(args.out_dir + RUN_CAT_FILE)
+        except FileNotFoundError:
+            print('No run catalogue found. Quitting...')
+            quit()
+    
     # connect to SpaceTrack and obtain catalogue for INT run
     st = ST()
     run_cat = st.getRunCat(dates,
                            args.cat_type,
                            args.out_dir)
     
-    # organise resulting catalogue into user-friendly format
-    epoch_cat = organiseCat(run_cat, args.out_dir) 
+    if args.update:
+        # merge new elsets into existing catalogue
+        updateCat(org_cat, run_cat, args.out_dir)
+    else:
+        # organise resulting catalogue into user-friendly format
+        epoch_cat = organiseCat(run_cat, args.out_dir) 
+    
+    stopProfiling(args, profiler)
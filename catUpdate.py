@@ -0,0 +1,79 @@
+"""
+Merge new element sets into an existing run catalogue
+"""
+
+from tle import (
+    updateCat,
+    loadRunCat,
+    compactCat,
+    RUN_CAT_FILE,
+    )
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
+    )
+import argparse as ap
+
+try:
+    FileNotFoundError
+except NameError:
+    FileNotFoundError = IOError
+
+def argParse():
+    """
+    Argument parser settings
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    args : array-like
+        Array of command line arguments
+    """
+    parser = ap.ArgumentParser()
+    
+    parser.add_argument('tle_path',
+                        help='path to text file of new 3les, e.g. from '
+                             'pullTLE',
+                        type=str)
+    
+    parser.add_argument('out_dir',
+                        help='directory containing the run catalogue',
+                        type=str)
+    
+    parser.add_argument('--compact',
+                        help='rewrite run_cat.json in full afterwards, '
+                             'folding in all journalled updates',
+                        action='store_true')
+    
+    addProfilingArgs(parser)
+    
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    
+    args = argParse()
+    profiler = startProfiling(args)
+    
+    try:
+        run_cat = loadRunCat(args.out_dir + RUN_CAT_FILE)
+    except FileNotFoundError:
+        print('No run catalogue found. Quitting...')
+        quit()
+    
+    try:
+        with open(args.tle_path, 'r') as f:
+            cat = [line.rstrip('\n') for line in f if line.strip()]
+    except FileNotFoundError:
+        print('No tle file found. Quitting...')
+        quit()
+    
+    updateCat(run_cat, cat, args.out_dir)
+    
+    if args.compact:
+        compactCat(run_cat, args.out_dir)
+    
+    stopProfiling(args, profiler)
@@ -0,0 +1,238 @@
+"""
+Precompute ephemeris tables for every catalogue object over a night
+
+Writes dense (objects x times) tables of RA, Dec, HA, altitude and range
+to memory-mapped .npy files, which any number of processes can then read
+zero-copy with loadEphemTable (or np.load(..., mmap_mode='r')).
+"""
+
+from tle import (
+    parsePlotGEOInput,
+    getTimescale,
+    TLE,
+    SITE_LATITUDE,
+    SITE_LONGITUDE,
+    SITE_ELEVATION,
+    )
+from reduction import batchTopocentric
+from visibility import preFilter
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
+    stage,
+    count,
+    Progress,
+    )
+import json
+import argparse as ap
+from os.path import isdir
+from os import mkdir
+
+try:
+    FileNotFoundError
+except NameError:
+    FileNotFoundError = IOError
+
+TABLE_COLUMNS = ['ra', 'dec', 'ha', 'alt', 'range']
+
+def argParse():
+    """
+    Argument parser settings
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    args : array-like
+        Array of command line arguments
+    """
+    parser = ap.ArgumentParser()
+    
+    parser.add_argument('cat_path',
+                        help='path to catalogue json file',
+                        type=str)
+    
+    parser.add_argument('out_dir',
+                        help='output directory for resulting tables',
+                        type=str)
+    
+    parser.add_argument('start',
+                        help='start of night [utc], '
+                             'format "YYYY-mm-ddTHH:MM:SS"',
+                        type=str)
+    
+    parser.add_argument('timestep',
+                        help='timestep between each exposure [seconds]',
+                        type=float)
+    
+    parser.add_argument('n_steps',
+                        help='number of timesteps',
+                        type=int)
+    
+    parser.add_argument('--lat',
+                        help='site latitude [deg], default {}'.format(
+                            str(SITE_LATITUDE)),
+                        type=float,
+                        default=SITE_LATITUDE)
+    
+    parser.add_argument('--lon',
+                        help='site longitude [deg, east], default {}'.format(
+                            str(SITE_LONGITUDE)),
+                        type=float,
+                        default=SITE_LONGITUDE)
+    
+    parser.add_argument('--elev',
+                        help='site elevation [m], default {}'.format(
+                            str(SITE_ELEVATION)),
+                        type=float,
+                        default=SITE_ELEVATION)
+    
+    parser.add_argument('--prefilter',
+                        help='skip objects that cannot be above the '
+                             'horizon and sunlit at any timestep',
+                        action='store_true')
+    
+    parser.add_argument('--chunk',
+                        help='number of objects to hold in memory at '
+                             'once, default 1000',
+                        type=int,
+                        default=1000)
+    
+    addProfilingArgs(parser)
+    
+    return parser.parse_args()
+
+def writeEphemTable(cat, observer, times, out_dir, chunk=1000):
+    """
+    Compute ephemerides of catalogue objects and write them to
+    memory-mapped .npy files
+    
+    Objects are processed in chunks and flushed to disk as they go, so
+    the tables may exceed the available memory.
+    
+    Parameters
+    ----------
+    cat : dict
+        Catalogue of tles, keyed by norad id, e.g. epoch_cat.json
+    observer : skyfield Topos object
+        Location of the observer
+    times : skyfield Time object
+        Array of times at which to compute positions
+    out_dir : str
+        Output directory in which to store the tables
+    chunk : int, optional
+        Number of objects to hold in memory at once
+        Default = 1000
+    
+    Returns
+    -------
+    None
+    """
+    import numpy as np
+    from numpy.lib.format import open_memmap
+    
+    if not isdir(out_dir):
+        mkdir(out_dir)
+    
+    norad_ids = sorted(cat.keys(), key=int)
+    shape = (len(norad_ids), len(times))
+    
+    np.save(out_dir + 'ids.npy', np.array(norad_ids, dtype=np.int64))
+    np.save(out_dir + 'times_tt.npy', times.tt)
+    
+    tables = {}
+    for column in TABLE_COLUMNS:
+        tables.update({column:open_memmap(out_dir + column + '.npy',
+                                          mode='w+',
+                                          dtype=np.float64,
+                                          shape=shape)})
+    
+    progress = Progress(len(norad_ids))
+    for c in range(0, len(norad_ids), chunk):
+        progress.update(c)
+        
+        with stage('propagate'):
+            tles = [TLE(cat[norad_id][0], cat[norad_id][1])
+                    for norad_id in norad_ids[c:c+chunk]]
+            rows = batchTopocentric(tles, observer, times)
+        count('propagate', len(rows['ra']) * len(times))
+        
+        with stage('write'):
+            for column in TABLE_COLUMNS:
+                tables[column][c:c+chunk] = rows[column]
+                tables[column].flush()
+    progress.done()
+    
+    print('Processed {} objects at {} times'.format(str(shape[0]),
+                                                    str(shape[1])))
+    
+    return None
+
+def loadEphemTable(out_dir):
+    """
+    Load ephemeris tables written by writeEphemTable, without copying
+    
+    Parameters
+    ----------
+    out_dir : str
+        Directory containing the tables
+    
+    Returns
+    -------
+    table : dict
+        Read-only memory-mapped arrays keyed by column name, plus 'ids'
+        (norad ids, one per row) and 'times_tt' (TT julian dates, one
+        per column)
+    """
+    import numpy as np
+    
+    table = {}
+    for column in TABLE_COLUMNS + ['ids', 'times_tt']:
+        table.update({column:np.load(out_dir + column + '.npy',
+                                     mmap_mode='r')})
+    
+    return table
+
+if __name__ == "__main__":
+	
+	args = argParse()
+	profiler = startProfiling(args)
+	
+	try:
+		with open(args.cat_path, 'r') as cp:
+			cat = json.load(cp)
+	except FileNotFoundError:
+		print('No catalogue file found. Please rectify...')
+		quit()
+	
+	start_utc = parsePlotGEOInput(args)
+	
+	import numpy as np
+	from datetime import timedelta
+	from skyfield.api import Topos
+	
+	if args.prefilter:
+		with stage('prefilter'):
+			cat, _ = preFilter(cat,
+			                   [start_utc + k*timedelta(seconds=args.timestep)
+			                    for k in range(args.n_steps)],
+			                   args.lat,
+			                   args.lon)
+		count('prefilter', len(cat))
+	
+	observer = Topos(args.lat, args.lon, elevation_m=args.elev)
+	
+	ts = getTimescale()
+	times = ts.utc(start_utc.year,
+	               start_utc.month,
+	               start_utc.day,
+	               start_utc.hour,
+	               start_utc.minute,
+	               start_utc.second + np.arange(args.n_steps)*args.timestep)
+	
+	writeEphemTable(cat, observer, times, args.out_dir, args.chunk)
+	
+	stopProfiling(args, profiler)
@@ -5,34 +5,33 @@ Testing platform for GEOPlot software
 from tle import (
     parsePlotGEOInput,
     requestFOV,
+    getTimescale,
+    getObserver,
     TLE,
     Instrument,
+    SITE_LATITUDE,
+    SITE_LONGITUDE,
+    SITE_ELEVATION,
+    )
+from reduction import batchTopocentric
+from visibility import preFilter
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
+    stage,
+    count,
     )
 import json
 import argparse as ap
-from astropy.time import Time
-from astropy import units as u
-from astropy.coordinates import (
-    Longitude, 
-    Latitude, 
-    EarthLocation
-    )
 from datetime import timedelta
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
 
 try:
     FileNotFoundError
 except NameError:
     FileNotFoundError = IOError
 
-SITE_LATITUDE = 28.7603135
-SITE_LONGITUDE = -17.8796168
-SITE_ELEVATION = 2387
-
-SITE_LOCATION = EarthLocation(lat=SITE_LATITUDE*u.deg,
-                              lon=SITE_LONGITUDE*u.deg,
-                              height=SITE_ELEVATION*u.m)
+DEC_LIMITS = (-33, 33) # plotted declination range
 
 def argParse():
     """
@@ -79,11 +78,33 @@ def argParse():
                         help='zoom into field of view?',
                         action='store_true')
     
+    parser.add_argument('--nofilter',
+                        help='plot every object, skipping the visibility '
+                             'pre-filter',
+                        action='store_true')
+    
+    addProfilingArgs(parser)
+    
     return parser.parse_args()
 
 if __name__ == "__main__":
 	
 	args = argParse()
+	profiler = startProfiling(args)
+	
+	# heavy imports deferred until after argument parsing
+	from astropy.time import Time
+	from astropy import units as u
+	from astropy.coordinates import (
+	    Longitude, 
+	    EarthLocation,
+	    )
+	import matplotlib.pyplot as plt
+	from matplotlib.patches import Rectangle
+	
+	SITE_LOCATION = EarthLocation(lat=SITE_LATITUDE*u.deg,
+	                              lon=SITE_LONGITUDE*u.deg,
+	                              height=SITE_ELEVATION*u.m)
 	
 	try:
 		with open(args.cat_path, 'r') as cp:
@@ -98,6 +119,20 @@ if __name__ == "__main__":
 		ra_fov, dec_fov = requestFOV()
 		instrument = Instrument(args.fov)
 	
+	# prune objects that cannot be seen on any frame
+	if not args.nofilter:
+		with stage('prefilter'):
+			cat, _ = preFilter(cat,
+			                   [start_utc + i*timedelta(minutes=args.timestep)
+			                    for i in range(args.n_steps)],
+			                   SITE_LATITUDE,
+			                   SITE_LONGITUDE,
+			                   dec_range=DEC_LIMITS)
+		count('prefilter', len(cat))
+	
+	# parse once, then propagate the whole catalogue per frame
+	tles = [TLE(cat[norad_id][0], cat[norad_id][1]) for norad_id in cat]
+	
 	for i in range(args.n_steps):
 		
 		time = start_utc + i*timedelta(minutes=args.timestep)
@@ -105,53 +140,52 @@ if __name__ == "__main__":
 		lst = Time(time, scale='utc', 
 		           location=SITE_LOCATION).sidereal_time('apparent')
 		
-		ha_list = []
-		dec_list = []
-		for n, norad_id in enumerate(cat):
+		with stage('propagate'):
+			coords = batchTopocentric(tles, 
+			                          getObserver(),
+			                          getTimescale().from_datetimes([time]))
 			
-			print('Processing {} {}/{}'.format(str(i+1),
-			                                   str(n+1),
-                                               str(len(cat))), end="\r")
+			ha_list = (lst.hourangle - coords['ra'][:, 0] + 12) % 24 - 12
+			dec_list = coords['dec'][:, 0]
+		count('propagate', len(tles))
+		
+		with stage('plot'):
+			#plt.style.use('dark_background')
+			fig = plt.figure(figsize=(10, 6))
+			ax = fig.add_subplot(111)
 			
-			tle = TLE(cat[norad_id][0], cat[norad_id][1])
-			ra, dec = tle.radec(time)
+			plt.plot(ha_list, dec_list, 'c.', ms=3)
 			
-			ha_list.append((lst - ra).wrap_at(12*u.hourangle).hourangle)
-			dec_list.append(dec)
-		
-		#plt.style.use('dark_background')
-		fig = plt.figure(figsize=(10, 6))
-		ax = fig.add_subplot(111)
-		
-		plt.plot(ha_list, dec_list, 'c.', ms=3)
-		
-		# Add FOV if requested
-		if args.fov:
-			ha_fov = Longitude((lst - ra).wrap_at(12*u.hourangle),
-			                   u.hourangle)
+			# Add FOV if requested
+			if args.fov:
+				ha_fov = Longitude((lst - ra_fov).wrap_at(12*u.hourangle),
+				                   u.hourangle)
+				
+				x = ha_fov - instrument.fov_ra / 2
+				y = dec_fov - instrument.fov_dec / 2
+				
+				fov = Rectangle(xy=(x.hourangle, y.deg),
+							    width=instrument.fov_ra.hourangle,
+							    height=instrument.fov_dec.deg)
+				
+				fov.set_facecolor('red')
+				fov.set_edgecolor('red')
+				print('got here')
+				ax.add_artist(fov)
 			
-			x = ha_fov - instrument.fov_ra / 2
-			y = dec_fov - instrument.fov_dec / 2
+			plt.title(str(time))
 			
-			fov = Rectangle(xy=(x.hourangle, y.deg),
-						    width=instrument.fov_ra.hourangle,
-						    height=instrument.fov_dec.deg)
+			plt.xlabel('Hour angle / hr')
+			plt.ylabel('Declination / $^\circ$')
 			
-			fov.set_facecolor('red')
-			fov.set_edgecolor('red')
-			print('got here')
-			ax.add_artist(fov)
-		
-		plt.title(str(time))
-		
-		plt.xlabel('Hour angle / hr')
-		plt.ylabel('Declination / $^\circ$')
-		
-		plt.xlim(-12, 12)
-		plt.ylim(-33, 33)
+			plt.xlim(-12, 12)
+			plt.ylim(*DEC_LIMITS)
+		count('plot')
 		
 		plt.show()
 		
 		input('enter')
 		
 		plt.savefig(args.out_dir + 'blah')
+	
+	stopProfiling(args, profiler)
@@ -0,0 +1,296 @@
+"""
+Stage-level timers, counters and throttled progress reporting
+"""
+
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+PROGRESS_INTERVAL = 0.5 # minimum time [s] between progress updates
+
+class Metrics:
+    """
+    Accumulated timers and counters for each pipeline stage
+    """
+    def __init__(self):
+        self.timers = {}
+        self.calls = {}
+        self.counters = {}
+        self.lock = threading.Lock() # shared by server handler threads
+    
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of code, accumulating under the given stage name
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self.lock:
+                self.timers.update({name:self.timers.get(name, 0.) + 
+                                    elapsed})
+                self.calls.update({name:self.calls.get(name, 0) + 1})
+    
+    def count(self, name, n=1):
+        """
+        Increment the named counter
+        """
+        with self.lock:
+            self.counters.update({name:self.counters.get(name, 0) + n})
+    
+    def summary(self):
+        """
+        Timers and counters in a json-friendly format
+        """
+        with self.lock:
+            return {'timers':{name:{'seconds':self.timers[name],
+                                    'calls':self.calls[name]}
+                              for name in self.timers},
+                    'counters':dict(self.counters)}
+    
+    def report(self):
+        """
+        Print a summary of where time went
+        """
+        summary = self.summary()
+        for name in summary['timers']:
+            seconds = summary['timers'][name]['seconds']
+            n = summary['counters'].get(name)
+            rate = ('{:10.1f} /s'.format(n / seconds)
+                    if n and seconds > 0 else '')
+            print('{:>10}: {:10.4f} s {:>10} items {}'.format(
+                name,
+                seconds,
+                str(n) if n is not None else '-',
+                rate))
+    
+    def dump(self, path):
+        """
+        Write timers and counters to a json file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+METRICS = Metrics()
+
+_STOPPED = False
+
+def stage(name):
+    """
+    Time a block of code under the given stage name, e.g.
+    
+        with stage('propagate'):
+            ...
+    """
+    return METRICS.stage(name)
+
+def count(name, n=1):
+    """
+    Increment the named counter of the shared metrics
+    """
+    METRICS.count(name, n)
+
+class Progress:
+    """
+    Progress line, redrawn at most once per interval rather than per item
+    """
+    def __init__(self, total, label='Processing',
+                 interval=PROGRESS_INTERVAL):
+        """
+        Initiate progress line
+        
+        Parameters
+        ----------
+        total : int
+            Total number of items
+        label : str, optional
+            Text preceding the item count
+            Default = 'Processing'
+        interval : float, optional
+            Minimum time [s] between updates
+            Default = PROGRESS_INTERVAL
+        """
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.last = 0.
+    
+    def update(self, n):
+        """
+        Report that n items have been processed, if the interval has
+        passed since the last update
+        """
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            print('{} {}/{}'.format(self.label,
+                                    str(n),
+                                    str(self.total)), end="\r")
+    
+    def done(self):
+        """
+        Report completion
+        """
+        print('{} {}/{}'.format(self.label,
+                                str(self.total),
+                                str(self.total)))
+
+class ThreadProfiler:
+    """
+    cProfile across worker threads, e.g. server request handlers
+    
+    Up to Python 3.11 cProfile only sees the thread that enabled it, so 
+    each block of work is profiled separately and the results merged. 
+    From 3.12 cProfile is process-wide and only one may be active, so a 
+    single profiler is enabled up front instead.
+    """
+    def __init__(self):
+        import cProfile
+        
+        self.stats = None
+        self.lock = threading.Lock()
+        self.profiler = None
+        if sys.version_info >= (3, 12):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+    
+    @contextmanager
+    def profile(self):
+        """
+        Profile a block of code in the calling thread
+        """
+        if self.profiler is not None:
+            yield # already covered by the process-wide profiler
+            return
+        
+        import cProfile
+        import pstats
+        
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+    
+    def getStats(self):
+        """
+        Stop profiling and return the merged stats, or None if nothing
+        was profiled
+        """
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            return pstats.Stats(self.profiler)
+        
+        with self.lock:
+            return self.stats
+
+def addProfilingArgs(parser):
+    """
+    Add the shared instrumentation flags to a command line parser
+    
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser object
+        Parser to extend
+    
+    Returns
+    -------
+    None
+    """
+    parser.add_argument('--metrics',
+                        help='write stage timers and counters to this '
+                             'json file',
+                        type=str)
+    
+    parser.add_argument('--profile',
+                        help='run under cProfile, writing stats to this '
+                             'file',
+                        type=str)
+    
+    return None
+
+def startProfiling(args, threads=False):
+    """
+    Start cProfile if requested on the command line
+    
+    stopProfiling is also registered to run at exit, so metrics and 
+    stats are still written if the script quits early.
+    
+    Parameters
+    ----------
+    args : argparse object
+        Arguments returned by argparse user interaction
+    threads : bool, optional
+        Profile work in other threads (through ThreadProfiler.profile) 
+        rather than the calling thread
+        Default = False
+    
+    Returns
+    -------
+    profiler : cProfile.Profile, ThreadProfiler object or None
+        Running profiler, to be passed to stopProfiling
+    """
+    if not args.profile:
+        profiler = None
+    elif threads:
+        profiler = ThreadProfiler()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
+    atexit.register(stopProfiling, args, profiler)
+    
+    return profiler
+
+def stopProfiling(args, profiler=None):
+    """
+    Stop profiling and write out any requested metrics
+    
+    Parameters
+    ----------
+    args : argparse object
+        Arguments returned by argparse user interaction
+    profiler : cProfile.Profile or ThreadProfiler object, optional
+        Profiler returned by startProfiling
+        Default = None
+    
+    Returns
+    -------
+    None
+    """
+    global _STOPPED
+    if _STOPPED:
+        return None
+    _STOPPED = True
+    
+    if isinstance(profiler, ThreadProfiler):
+        stats = profiler.getStats()
+    elif profiler is not None:
+        import pstats
+        profiler.disable()
+        stats = pstats.Stats(profiler)
+    else:
+        stats = None
+    
+    if stats is not None:
+        stats.dump_stats(args.profile)
+        stats.sort_stats('cumulative').print_stats(20)
+    
+    if args.metrics:
+        METRICS.report()
+        METRICS.dump(args.metrics)
+    
+    return None
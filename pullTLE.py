@@ -4,7 +4,15 @@ Pulls latest elsets from Space-Track
 """
 
 from spacetrack import SpaceTrackClient
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
+    stage,
+    count,
+    )
 import datetime
+import argparse as ap
 from os.path import realpath, dirname, isdir
 from os import mkdir
 
@@ -55,13 +63,41 @@ def getSatCat(name='', pw='',
     if not isdir(filepath + yr + mth):
         mkdir(filepath + yr + mth)
     
+    n_lines = 0
     with open(filepath + yr + mth + '/tle_' + date_str + '.txt', 'w') as f:
-        for line in data:
-            f.write(line + '\n')
+        with stage('fetch'):
+            for line in data:
+                f.write(line + '\n')
+                n_lines += 1
+    count('fetch', n_lines)
     
     return None
 
+def argParse():
+    """
+    Argument parser settings
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    args : array-like
+        Array of command line arguments
+    """
+    parser = ap.ArgumentParser()
+    
+    addProfilingArgs(parser)
+    
+    return parser.parse_args()
+
 if __name__ == "__main__":
     
+    args = argParse()
+    profiler = startProfiling(args)
+    
     # pull sat 3les from Space-Track
     getSatCat()
+    
+    stopProfiling(args, profiler)
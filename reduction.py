@@ -0,0 +1,180 @@
+"""
+Batch topocentric reduction of many element sets at many times
+
+The TEME -> GCRS -> topocentric RA/Dec, HA and altitude chain is fused
+into a single Numba kernel, with the time-dependent frame rotations taken
+from skyfield once per time rather than once per object. Falls back to
+skyfield's general-purpose frame machinery when Numba is not installed.
+"""
+
+import math
+
+_KERNEL = None
+
+def _buildKernel():
+    """
+    Compile the fused reduction kernel, or return None if Numba is
+    unavailable
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+    
+    @njit(parallel=True, cache=True)
+    def kernel(r_teme, errors, R_gcrs, R_itrs, obs_gcrs,
+               lat, lon, ra, dec, ha, alt, dist):
+        n_obj, n_t = errors.shape
+        sin_lat = math.sin(lat)
+        cos_lat = math.cos(lat)
+        sin_lon = math.sin(lon)
+        cos_lon = math.cos(lon)
+        for i in prange(n_obj):
+            for j in range(n_t):
+                if errors[i, j] != 0:
+                    ra[i, j] = math.nan
+                    dec[i, j] = math.nan
+                    ha[i, j] = math.nan
+                    alt[i, j] = math.nan
+                    dist[i, j] = math.nan
+                    continue
+                
+                # TEME -> GCRS, then relative to the observer
+                x = r_teme[i, j, 0]
+                y = r_teme[i, j, 1]
+                z = r_teme[i, j, 2]
+                gx = (R_gcrs[0, 0, j]*x + R_gcrs[0, 1, j]*y +
+                      R_gcrs[0, 2, j]*z - obs_gcrs[0, j])
+                gy = (R_gcrs[1, 0, j]*x + R_gcrs[1, 1, j]*y +
+                      R_gcrs[1, 2, j]*z - obs_gcrs[1, j])
+                gz = (R_gcrs[2, 0, j]*x + R_gcrs[2, 1, j]*y +
+                      R_gcrs[2, 2, j]*z - obs_gcrs[2, j])
+                r = math.sqrt(gx*gx + gy*gy + gz*gz)
+                
+                ra[i, j] = math.atan2(gy, gx) % (2*math.pi)
+                dec[i, j] = math.asin(gz / r)
+                dist[i, j] = r
+                
+                # GCRS -> ITRS for hour angle and altitude
+                ix = (R_itrs[0, 0, j]*gx + R_itrs[0, 1, j]*gy +
+                      R_itrs[0, 2, j]*gz)
+                iy = (R_itrs[1, 0, j]*gx + R_itrs[1, 1, j]*gy +
+                      R_itrs[1, 2, j]*gz)
+                iz = (R_itrs[2, 0, j]*gx + R_itrs[2, 1, j]*gy +
+                      R_itrs[2, 2, j]*gz)
+                
+                h = (lon - math.atan2(iy, ix) + math.pi) % (2*math.pi)
+                ha[i, j] = h - math.pi
+                
+                # project onto the local zenith
+                up = cos_lat*(cos_lon*ix + sin_lon*iy) + sin_lat*iz
+                alt[i, j] = math.asin(up / r)
+    
+    return kernel
+
+def getKernel():
+    """
+    Obtain the compiled reduction kernel, compiling on first use
+    
+    Returns
+    -------
+    kernel : function or None
+        Fused kernel, or None if Numba is unavailable
+    """
+    global _KERNEL
+    if _KERNEL is None:
+        _KERNEL = _buildKernel() or False
+    
+    return _KERNEL or None
+
+def batchTopocentric(tles, observer, times):
+    """
+    Determine topocentric coords of many objects at many times
+    
+    Parameters
+    ----------
+    tles : array-like
+        TLE objects
+    observer : skyfield Topos object
+        Location of the observer
+    times : skyfield Time object
+        Array of times, or a single time
+    
+    Returns
+    -------
+    coords : dict
+        (objects x times) arrays of 'ra' [hours, ICRS], 'dec' [deg],
+        'ha' [hours, -12 to 12], 'alt' [deg] and 'range' [km], or 
+        (objects,) arrays for a single time; NaN where SGP4 fails
+    """
+    import numpy as np
+    
+    if times.shape == ():
+        times = times.ts.tai_jd(np.atleast_1d(times.whole),
+                                np.atleast_1d(times.tai_fraction))
+        coords = batchTopocentric(tles, observer, times)
+        return {column:coords[column][:, 0] for column in coords}
+    
+    shape = (len(tles), len(times))
+    kernel = getKernel()
+    if kernel is None:
+        return _skyfieldTopocentric(tles, observer, times)
+    
+    from sgp4.api import SatrecArray
+    from skyfield.sgp4lib import TEME
+    from skyfield.framelib import itrs
+    
+    # per-time quantities, shared by every object
+    jd = times.whole
+    fr = times.tai_fraction - times._leap_seconds() / 86400.
+    R_teme = TEME.rotation_at(times)
+    R_gcrs = np.ascontiguousarray(np.swapaxes(R_teme, 0, 1))
+    R_itrs = np.ascontiguousarray(itrs.rotation_at(times))
+    obs_gcrs = np.ascontiguousarray(observer.at(times).position.km)
+    
+    sats = SatrecArray([tle.obj.model for tle in tles])
+    errors, r_teme, _ = sats.sgp4(np.atleast_1d(jd), np.atleast_1d(fr))
+    
+    ra = np.empty(shape)
+    dec = np.empty(shape)
+    ha = np.empty(shape)
+    alt = np.empty(shape)
+    dist = np.empty(shape)
+    kernel(r_teme, errors, R_gcrs.reshape(3, 3, -1),
+           R_itrs.reshape(3, 3, -1), obs_gcrs.reshape(3, -1),
+           observer.latitude.radians, observer.longitude.radians,
+           ra, dec, ha, alt, dist)
+    
+    return {'ra':np.degrees(ra) / 15.,
+            'dec':np.degrees(dec),
+            'ha':np.degrees(ha) / 15.,
+            'alt':np.degrees(alt),
+            'range':dist}
+
+def _skyfieldTopocentric(tles, observer, times):
+    """
+    Determine topocentric coords through skyfield, one object at a time
+    """
+    import numpy as np
+    
+    shape = (len(tles), len(times))
+    coords = {column:np.empty(shape)
+              for column in ['ra', 'dec', 'ha', 'alt', 'range']}
+    for n, tle in enumerate(tles):
+        pos = (tle.obj - observer).at(times)
+        
+        ra, dec, dist = pos.radec()
+        ha, _, _ = pos.hadec()
+        alt, _, _ = pos.altaz()
+        
+        coords['ra'][n] = ra.hours
+        coords['dec'][n] = dec.degrees
+        coords['ha'][n] = ha.hours
+        coords['alt'][n] = alt.degrees
+        coords['range'][n] = dist.km
+        
+        failed = [message is not None for message in pos.message]
+        for column in coords:
+            coords[column][n][failed] = np.nan
+    
+    return coords
@@ -0,0 +1,291 @@
+"""
+Generate synthetic 3le catalogues for offline testing and benchmarking
+"""
+
+import random
+import argparse as ap
+from tle import ALPHA5
+from profiling import (
+    addProfilingArgs,
+    startProfiling,
+    stopProfiling,
+    stage,
+    count,
+    )
+from datetime import (
+    datetime,
+    timedelta,
+    )
+
+# (eccentricity, mean motion [rev/day], inclination [deg]) ranges
+ORBIT_RANGES = {'geo':((0., 0.01), (0.99, 1.01), (0., 15.)),
+                'leo':((0., 0.05), (11.25, 16.), (0., 100.)),
+                'meo':((0., 0.25), (1.8, 2.4), (50., 65.)),
+                'heo':((0.25, 0.75), (2., 3.), (60., 66.))}
+
+DEFAULT_MIX = 'geo=0.2,leo=0.6,meo=0.1,heo=0.1'
+
+TLE_LENGTH = 69
+MAX_NORAD_ID = (len(ALPHA5) + 10) * 10000 - 1 # Z9999
+
+def argParse():
+    """
+    Argument parser settings
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    args : array-like
+        Array of command line arguments
+    """
+    parser = ap.ArgumentParser()
+    
+    parser.add_argument('n_objects',
+                        help='number of objects in the catalogue',
+                        type=int)
+    
+    parser.add_argument('out_dir',
+                        help='output directory for resulting catalogue',
+                        type=str)
+    
+    parser.add_argument('--start',
+                        help='start epoch, format YYYY-mm-dd, '
+                             'default 2018-05-01',
+                        type=str,
+                        default='2018-05-01')
+    
+    parser.add_argument('--end',
+                        help='end epoch, format YYYY-mm-dd, '
+                             'default 2018-05-08',
+                        type=str,
+                        default='2018-05-08')
+    
+    parser.add_argument('--sets',
+                        help='number of element sets per object, '
+                             'default 3',
+                        type=int,
+                        default=3)
+    
+    parser.add_argument('--mix',
+                        help='orbit mix as comma-separated type=weight, '
+                             'default "{}"'.format(DEFAULT_MIX),
+                        type=str,
+                        default=DEFAULT_MIX)
+    
+    parser.add_argument('--seed',
+                        help='random seed, default 0',
+                        type=int,
+                        default=0)
+    
+    addProfilingArgs(parser)
+    
+    return parser.parse_args()
+
+def parseMix(mix):
+    """
+    Read an orbit mix string in a more useful format
+    
+    Parameters
+    ----------
+    mix : str
+        Comma-separated type=weight pairs, e.g. 'geo=0.5,leo=0.5'
+    
+    Returns
+    -------
+    orb_types, weights : array-like
+        Orbit types and their relative weights
+    """
+    orb_types = []
+    weights = []
+    try:
+        for item in mix.split(','):
+            orb_type, weight = item.split('=')
+            if orb_type.lower() not in ORBIT_RANGES:
+                raise ValueError
+            orb_types.append(orb_type.lower())
+            weights.append(float(weight))
+    except ValueError:
+        print('Incorrect format! Please supply a mix such as '
+              '"{}"...'.format(DEFAULT_MIX))
+        quit()
+    
+    return orb_types, weights
+
+def computeChecksum(line):
+    """
+    Modulo 10 checksum of a tle line (excluding the checksum digit)
+    
+    Parameters
+    ----------
+    line : str
+        First 68 characters of a tle line
+    
+    Returns
+    -------
+    checksum : int
+        Checksum digit
+    """
+    checksum = 0
+    for char in line[:68]:
+        if char.isdigit():
+            checksum += int(char)
+        elif char == '-':
+            checksum += 1
+    
+    return checksum % 10
+
+def formatNoradId(norad_id):
+    """
+    Convert a norad id to the 5 character tle field, using Alpha-5 
+    beyond 99999, e.g. 100001 = 'A0001'
+    """
+    if norad_id > MAX_NORAD_ID:
+        raise ValueError('Norad id {} exceeds Alpha-5 range'.format(
+            str(norad_id)))
+    
+    if norad_id < 100000:
+        return '{:05d}'.format(norad_id)
+    
+    return '{}{:04d}'.format(ALPHA5[norad_id // 10000 - 10],
+                             norad_id % 10000)
+
+def formatEpoch(epoch):
+    """
+    Convert a datetime object to tle epoch format, YYDDD.DDDDDDDD
+    """
+    day_start = datetime(epoch.year, epoch.month, epoch.day)
+    frac = (epoch - day_start).total_seconds() / 86400.
+    
+    return '{:02d}{:03d}.{:08d}'.format(epoch.year % 100,
+                                        epoch.timetuple().tm_yday,
+                                        int(round(frac * 1e8)) % 10**8)
+
+def generate3LE(norad_id, epoch, e, mm, inc, raan, argp, ma, n_set):
+    """
+    Format a single checksum-valid 3le
+    
+    Returns
+    -------
+    name, line1, line2 : str
+        Lines of the 3le
+    """
+    name = '0 SYNTH {}'.format(str(norad_id))
+    
+    line1 = '1 {}U {:02d}{:03d}A   {} {} {} {} 0 {:>4d}'.format(
+        formatNoradId(norad_id),
+        epoch.year % 100,
+        norad_id % 1000,
+        formatEpoch(epoch),
+        ' .00000000',
+        ' 00000-0',
+        ' 00000-0',
+        n_set % 10000)
+    line1 += str(computeChecksum(line1))
+    
+    line2 = '2 {} {:8.4f} {:8.4f} {:07d} {:8.4f} {:8.4f} {:11.8f}' \
+            '{:05d}'.format(
+        formatNoradId(norad_id),
+        inc,
+        raan,
+        int(round(e * 1e7)),
+        argp,
+        ma,
+        mm,
+        n_set % 100000)
+    line2 += str(computeChecksum(line2))
+    
+    # a field overflowing its columns would corrupt the checksum
+    assert len(line1) == TLE_LENGTH and len(line2) == TLE_LENGTH
+    
+    return name, line1, line2
+
+def generateCat(n_objects, start, end, n_sets=3, mix=DEFAULT_MIX, seed=0):
+    """
+    Generate a synthetic run catalogue of 3les
+    
+    Parameters
+    ----------
+    n_objects : int
+        Number of objects in the catalogue
+    start, end : datetime objects
+        Range of element set epochs
+    n_sets : int, optional
+        Number of element sets per object, spread through the epoch
+        range and propagated consistently from one set to the next
+        Default = 3
+    mix : str, optional
+        Orbit mix as comma-separated type=weight pairs
+        Default = DEFAULT_MIX
+    seed : int, optional
+        Random seed, so catalogues are reproducible
+        Default = 0
+    
+    Returns
+    -------
+    cat : array-like
+        List of 3le lines, in the format returned by ST.getRunCat
+        (sorted by epoch, as from Space-Track)
+    """
+    rng = random.Random(seed)
+    orb_types, weights = parseMix(mix)
+    span = (end - start).total_seconds()
+    
+    elsets = []
+    for n in range(n_objects):
+        norad_id = n + 1
+        e_lim, mm_lim, inc_lim = ORBIT_RANGES[rng.choices(orb_types,
+                                                          weights)[0]]
+        e = rng.uniform(*e_lim)
+        mm = rng.uniform(*mm_lim)
+        inc = rng.uniform(*inc_lim)
+        raan = rng.uniform(0., 360.)
+        argp = rng.uniform(0., 360.)
+        ma = rng.uniform(0., 360.)
+        
+        for s in range(n_sets):
+            dt = rng.uniform(0., span)
+            epoch = start + timedelta(seconds=dt)
+            ma_epoch = (ma + 360. * mm * dt / 86400.) % 360.
+            elsets.append((epoch,
+                           generate3LE(norad_id, epoch, e, mm, inc,
+                                       raan, argp, ma_epoch, s + 1)))
+    
+    elsets.sort(key=lambda elset: elset[0])
+    
+    cat = []
+    for _, lines in elsets:
+        cat += lines
+    
+    return cat
+
+if __name__ == "__main__":
+    
+    args = argParse()
+    profiler = startProfiling(args)
+    
+    try:
+        start = datetime.strptime(args.start, '%Y-%m-%d')
+        end = datetime.strptime(args.end, '%Y-%m-%d')
+    except ValueError:
+        print('Incorrect format! Please supply dates "YYYY-mm-dd"...')
+        quit()
+    
+    with stage('generate'):
+        cat = generateCat(args.n_objects,
+                          start,
+                          end,
+                          args.sets,
+                          args.mix,
+                          args.seed)
+    count('generate', len(cat) // 3)
+    
+    with open(args.out_dir + 'run_cat.txt', 'w') as f:
+        for line in cat:
+            f.write('{}\n'.format(line))
+    
+    print('Number of tles generated: {}'.format(str(len(cat) // 3)))
+    
+    stopProfiling(args, profiler)
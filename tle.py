@@ -2,37 +2,36 @@
 Module for dealing with Space-Track elsets
 """
 
+import os
 import json
 import getpass as gp
+from bisect import bisect_right
 from operator import itemgetter
-from astropy import units as u
-from astropy.coordinates import (
-    Longitude, 
-    Latitude, 
-    EarthLocation
+from profiling import (
+    stage,
+    count,
+    Progress,
     )
-from spacetrack import SpaceTrackClient
-import spacetrack.operators as op
 from datetime import (
     datetime,
     timedelta,
     )
-from skyfield.sgp4lib import EarthSatellite
-from skyfield.api import (
-    load, 
-    Topos, 
-    utc,
-    )
 
-TS = load.timescale() # save repeated use in iterative loops
+# heavy dependencies (astropy, skyfield, spacetrack) are imported where
+# they are used, so the command line scripts start quickly
+
 LE_FORMAT = '3le'     # TODO: generalise to allow for 'tle' format
 
+DATA_DIR = os.path.dirname(os.path.realpath(__file__)) + '/'
+DELTAT_DATA = DATA_DIR + 'deltat.data'
+DELTAT_PREDS = DATA_DIR + 'deltat.preds'
+
+RUN_CAT_FILE = 'run_cat.json'
+UPDATE_SUFFIX = '_updates.jsonl' # journal of merges since last write
+
 SITE_LATITUDE = 28.7603135
-SITE_LONGITUDE = 17.8796168
+SITE_LONGITUDE = -17.8796168 # east positive, i.e. 17.88 W
 SITE_ELEVATION = 2387
-TOPOS_LOCATION = Topos(SITE_LATITUDE, 
-                       SITE_LONGITUDE, 
-                       elevation_m=SITE_ELEVATION)
 
 GEO_CHECK = ['g', 'geo']
 LEO_CHECK = ['l', 'leo']
@@ -40,6 +39,107 @@ MEO_CHECK = ['m', 'meo']
 HEO_CHECK = ['h', 'heo']
 ALL_CHECK = ['a', 'all']
 
+# leading characters of Alpha-5 norad ids (>= 100000), I and O omitted
+ALPHA5 = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+
+_TS = None
+_TOPOS = None
+
+def getTimescale():
+    """
+    Obtain skyfield timescale without touching the network
+    
+    Uses the Delta-T and leap second tables shipped inside skyfield, 
+    which are kept current with each release. Versions of skyfield too 
+    old to ship them fall back on the bundled Delta-T files, with a 
+    warning if their predictions have already run out.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    ts : skyfield Timescale object
+        Timescale shared between all calls (save repeated use in 
+        iterative loops)
+    """
+    global _TS
+    if _TS is not None:
+        return _TS
+    
+    from skyfield.api import load
+    
+    try:
+        _TS = load.timescale(builtin=True)
+    except TypeError:
+        _TS = _bundledTimescale()
+    
+    return _TS
+
+def _bundledTimescale():
+    """
+    Build skyfield timescale from the bundled Delta-T files
+    """
+    import numpy as np
+    
+    # private to skyfield, hence guarded
+    try:
+        from skyfield.timelib import Timescale
+        from skyfield.functions import load_bundled_npy
+        from skyfield.io_timescale import (
+            parse_deltat_data,
+            parse_deltat_preds,
+            )
+    except ImportError:
+        raise ImportError('Unsupported skyfield version; please '
+                          'upgrade skyfield')
+    
+    with open(DELTAT_DATA, 'rb') as f:
+        deltat_data = parse_deltat_data(f)
+    with open(DELTAT_PREDS, 'rb') as f:
+        deltat_preds = parse_deltat_preds(f)
+    
+    # append predictions beyond the end of the measured data
+    i = np.searchsorted(deltat_preds[0], deltat_data[0, -1], 
+                        side='right')
+    delta_t_recent = np.concatenate([deltat_data, 
+                                     deltat_preds[:, i:]], axis=1)
+    
+    arrays = load_bundled_npy('iers.npz')
+    ts = Timescale(delta_t_recent, 
+                   arrays['leap_dates'], 
+                   arrays['leap_offsets'])
+    
+    if ts.now().tt > delta_t_recent[0, -1]:
+        print('Warning: bundled Delta-T predictions end before today; '
+              'positions will be inaccurate. Please refresh {} and '
+              '{}...'.format(DELTAT_DATA, DELTAT_PREDS))
+    
+    return ts
+
+def getObserver():
+    """
+    Obtain skyfield Topos object for the observing site
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    topos : skyfield Topos object
+        Location of the observing site
+    """
+    global _TOPOS
+    if _TOPOS is None:
+        from skyfield.api import Topos
+        _TOPOS = Topos(SITE_LATITUDE, 
+                       SITE_LONGITUDE, 
+                       elevation_m=SITE_ELEVATION)
+    
+    return _TOPOS
+
 class Orbit:
     """
     Convenience class for orbit-specific searches
@@ -86,6 +186,8 @@ class ST:
     Space-Track Interface
     """
     def __init__(self):
+        from spacetrack import SpaceTrackClient
+        
         un, pw = self.requestAccess()
         self.username = un
         self.password = pw
@@ -148,45 +250,47 @@ class ST:
         orb = Orbit(cat_type) 
         
         tles = []
-        for date in dates:
-            date_range = '{}--{}'.format(date[0].strftime('%Y-%m-%d'),
-                                         date[1].strftime('%Y-%m-%d'))
-            
-            if cat_type in GEO_CHECK + LEO_CHECK: 
-                result = self.client.tle(iter_lines=True,
-                                         eccentricity=orb.e_lim,
-                                         mean_motion=orb.mm_lim,
-                                         epoch=date_range,
-                                         limit=200000,
-                                         format=LE_FORMAT)
-            elif cat_type in MEO_CHECK:
-                result = self.client.tle(iter_lines=True,
-                                         eccentricity=orb.e_lim,
-                                         period=orb.p_lim,
-                                         epoch=date_range,
-                                         limit=200000,
-                                         format=LE_FORMAT)
-            elif cat_type in HEO_CHECK:
-                result = self.client.tle(iter_lines=True,
-                                         eccentricity=orb.e_lim,
-                                         epoch=date_range,
-                                         limit=200000,
-                                         format=LE_FORMAT)
-            elif cat_type in ALL_CHECK:
-                result = self.client.tle(iter_lines=True,
-                                         epoch=date_range,
-                                         limit=200000,
-                                         format=LE_FORMAT)
-            else:
-                print('Incorrect format! Please supply a valid' 
-                      'orbit type... \n'
-                      'GEO - "g" \n'
-                      'LEO - "l" \n'
-                      'MEO - "m" \n'
-                      'HEO - "h" \n'
-                      'ALL - "a" \n')
-            tles += [line for line in result]
+        with stage('fetch'):
+            for date in dates:
+                date_range = '{}--{}'.format(date[0].strftime('%Y-%m-%d'),
+                                             date[1].strftime('%Y-%m-%d'))
+                
+                if cat_type in GEO_CHECK + LEO_CHECK: 
+                    result = self.client.tle(iter_lines=True,
+                                             eccentricity=orb.e_lim,
+                                             mean_motion=orb.mm_lim,
+                                             epoch=date_range,
+                                             limit=200000,
+                                             format=LE_FORMAT)
+                elif cat_type in MEO_CHECK:
+                    result = self.client.tle(iter_lines=True,
+                                             eccentricity=orb.e_lim,
+                                             period=orb.p_lim,
+                                             epoch=date_range,
+                                             limit=200000,
+                                             format=LE_FORMAT)
+                elif cat_type in HEO_CHECK:
+                    result = self.client.tle(iter_lines=True,
+                                             eccentricity=orb.e_lim,
+                                             epoch=date_range,
+                                             limit=200000,
+                                             format=LE_FORMAT)
+                elif cat_type in ALL_CHECK:
+                    result = self.client.tle(iter_lines=True,
+                                             epoch=date_range,
+                                             limit=200000,
+                                             format=LE_FORMAT)
+                else:
+                    print('Incorrect format! Please supply a valid' 
+                          'orbit type... \n'
+                          'GEO - "g" \n'
+                          'LEO - "l" \n'
+                          'MEO - "m" \n'
+                          'HEO - "h" \n'
+                          'ALL - "a" \n')
+                tles += [line for line in result]
         
+        count('fetch', len(tles))
         print('Number of tles returned: {}'.format(str(len(tles))))
         
         if out_dir is not None:
@@ -205,12 +309,10 @@ class TLE:
         self.line2 = line2
         if name is not None:
             self.name = name[2:]
+        self._name = name
+        self._obj = None
         
-        self.obs = TOPOS_LOCATION
-        self.obj = EarthSatellite(line1, line2, name)
-        self.ts = TS
-        
-        self.norad_id = int(self.line1[2:7])
+        self.norad_id = getNoradId(self.line1)
         self.yday = float(self.line1[20:32])
         
         self.inclination = float(self.line2[8:16])
@@ -220,10 +322,37 @@ class TLE:
         self.mean_anomaly = float(self.line2[43:51])
         self.mean_motion = float(self.line2[52:63])
     
+    @property
+    def obs(self):
+        """
+        Observing site, shared between all TLE objects
+        """
+        return getObserver()
+    
+    @property
+    def ts(self):
+        """
+        Timescale, shared between all TLE objects
+        """
+        return getTimescale()
+    
+    @property
+    def obj(self):
+        """
+        Skyfield satellite, only built when first propagated
+        """
+        if self._obj is None:
+            from skyfield.sgp4lib import EarthSatellite
+            self._obj = EarthSatellite(self.line1, self.line2, self._name)
+        return self._obj
+    
     def radec(self, epoch):
         """
         Determine radec coords for a given epoch
         """
+        from astropy import units as u
+        from astropy.coordinates import Longitude
+        
         ra, dec, _ = (self.obj-self.obs).at(self.ts.utc(epoch)).radec()
         
         return Longitude(ra.hours, u.hourangle), dec.degrees
@@ -233,6 +362,12 @@ class Instrument:
     Convenience class for instrumental properties
     """
     def __init__(self, instrument):
+        from astropy import units as u
+        from astropy.coordinates import (
+            Longitude, 
+            Latitude,
+            )
+        
         if instrument.lower() == 'int':
             self.fov_ra = Longitude(0.5, u.deg)
             self.fov_dec = Latitude(0.5, u.deg)
@@ -297,6 +432,8 @@ def parsePlotGEOInput(args):
     start_utc : datetime object
         Start time [utc] in datetime format
     """
+    from skyfield.api import utc
+    
     try: 
         start_utc = datetime.strptime(args.start, '%Y-%m-%dT%H:%M:%S')
         start_utc = start_utc.replace(tzinfo=utc)
@@ -311,6 +448,12 @@ def requestFOV():
     """
     Request necessary information to plot FOV for a given night
     """
+    from astropy import units as u
+    from astropy.coordinates import (
+        Longitude, 
+        Latitude,
+        )
+    
     print('You have opted to plot a FOV. Please provide:')
     while True:
         try:
@@ -396,24 +539,248 @@ def organiseCat(cat, out_dir):
     org_cat : dict
         Run catalogue organised by norad id
     """
-    i = 0
-    org_cat = {}
-    while i < len(cat):
-        print('Processing {}/{}'.format(str(i),str(len(cat))), end="\r")
-        tle = TLE(cat[i+1], cat[i+2], name=cat[i])
-        if tle.norad_id in org_cat.keys():
-            org_cat[tle.norad_id].append([tle.line1,
-                                          tle.line2])
-        else:
-            org_cat.update({tle.norad_id:[[tle.line1,
-                                           tle.line2]]})
-        i += 3
+    progress = Progress(len(cat) // 3)
     
-    with open(out_dir + 'run_cat.json', 'w') as f:
+    with stage('parse'):
+        tles = []
+        i = 0
+        while i < len(cat):
+            progress.update(i // 3)
+            tles.append(TLE(cat[i+1], cat[i+2], name=cat[i]))
+            i += 3
+    count('parse', len(tles))
+    
+    with stage('group'):
+        org_cat = groupTLEs(tles)
+    count('group', len(tles))
+    progress.done()
+    
+    with open(out_dir + RUN_CAT_FILE, 'w') as f:
         json.dump(org_cat, f)
     
+    # any journalled updates are superseded by the fresh catalogue
+    if os.path.exists(getUpdatePath(out_dir + RUN_CAT_FILE)):
+        os.remove(getUpdatePath(out_dir + RUN_CAT_FILE))
+    
+    return org_cat
+
+def groupTLEs(tles):
+    """
+    Group parsed tles by norad id, each object's list in epoch order
+    
+    Parameters
+    ----------
+    tles : array-like
+        TLE objects
+    
+    Returns
+    -------
+    org_cat : dict
+        Lists of [line1, line2] element sets, keyed by norad id (str, 
+        as when loaded from json)
+    """
+    org_cat = {}
+    for tle in sorted(tles, key=lambda tle: getElsetEpoch(tle.line1)):
+        key = str(tle.norad_id)
+        if key in org_cat.keys():
+            org_cat[key].append([tle.line1,
+                                 tle.line2])
+        else:
+            org_cat.update({key:[[tle.line1,
+                                  tle.line2]]})
+    
     return org_cat
 
+def getNoradId(line1):
+    """
+    Obtain the norad id from the first line of a tle, including
+    Alpha-5 ids, e.g. 'A0001' = 100001
+    
+    Parameters
+    ----------
+    line1 : str
+        First line of the tle
+    
+    Returns
+    -------
+    norad_id : int
+        Norad id
+    """
+    field = line1[2:7]
+    if field[0] in ALPHA5:
+        return (ALPHA5.index(field[0]) + 10) * 10000 + int(field[1:])
+    
+    return int(field)
+
+def getElsetEpoch(line1):
+    """
+    Obtain a sortable epoch from the first line of a tle
+    
+    Parameters
+    ----------
+    line1 : str
+        First line of the tle
+    
+    Returns
+    -------
+    epoch : float
+        Epoch as year * 1000 + fractional year day
+    """
+    year = int(line1[18:20])
+    year += 1900 if year >= 57 else 2000
+    
+    return year * 1000 + float(line1[20:32])
+
+def insertElsets(run_cat, elsets):
+    """
+    Insert element sets into a run catalogue, keeping each object's 
+    list in epoch order and skipping any already present
+    
+    Parameters
+    ----------
+    run_cat : dict
+        Run catalogue keyed by norad id (str), as returned by 
+        organiseCat or loadRunCat (modified in place)
+    elsets : dict
+        Lists of [line1, line2] element sets, keyed by norad id
+    
+    Returns
+    -------
+    added : dict
+        Lists of the element sets actually inserted, keyed by norad id
+    """
+    added = {}
+    for norad_id in elsets:
+        key = str(norad_id)
+        obj_cat = run_cat.setdefault(key, [])
+        epochs = [getElsetEpoch(tle[0]) for tle in obj_cat]
+        line1s = set(tle[0] for tle in obj_cat)
+        
+        for tle in elsets[norad_id]:
+            if tle[0] in line1s:
+                continue
+            epoch = getElsetEpoch(tle[0])
+            idx = bisect_right(epochs, epoch)
+            obj_cat.insert(idx, [tle[0], tle[1]])
+            epochs.insert(idx, epoch)
+            line1s.add(tle[0])
+            added.setdefault(key, []).append([tle[0], tle[1]])
+        
+        if not obj_cat:
+            del run_cat[key]
+    
+    return added
+
+def updateCat(run_cat, cat, out_dir):
+    """
+    Merge newly pulled element sets into an existing run catalogue
+    
+    Only the new element sets are persisted, by appending them to a 
+    journal alongside run_cat.json, so the cost is proportional to the 
+    size of the update rather than the catalogue. The journal is 
+    replayed by loadRunCat and folded in by compactCat.
+    
+    Parameters
+    ----------
+    run_cat : dict
+        Run catalogue keyed by norad id (str), as returned by 
+        organiseCat or loadRunCat (modified in place)
+    cat : array-like
+        List of new 3les, in the format returned by ST.getRunCat
+    out_dir : str
+        Directory containing the run catalogue
+    
+    Returns
+    -------
+    added : dict
+        Lists of the element sets actually inserted, keyed by norad id
+    """
+    with stage('parse'):
+        elsets = {}
+        for i in range(0, len(cat), 3):
+            tle = TLE(cat[i+1], cat[i+2], name=cat[i])
+            elsets.setdefault(tle.norad_id, []).append([tle.line1, 
+                                                        tle.line2])
+    count('parse', len(cat) // 3)
+    
+    with stage('group'):
+        added = insertElsets(run_cat, elsets)
+    count('group', sum(len(added[norad_id]) for norad_id in added))
+    
+    if added:
+        with open(getUpdatePath(out_dir + RUN_CAT_FILE), 'a') as f:
+            f.write(json.dumps(added) + '\n')
+    
+    print('Number of new tles merged: {}'.format(
+        str(sum(len(added[norad_id]) for norad_id in added))))
+    
+    return added
+
+def getUpdatePath(run_path):
+    """
+    Path of the update journal belonging to a run catalogue, e.g. 
+    run_cat_updates.jsonl for run_cat.json, so catalogues sharing a
+    directory never replay each other's updates
+    """
+    return os.path.splitext(run_path)[0] + UPDATE_SUFFIX
+
+def loadRunCat(run_path):
+    """
+    Load a run catalogue, replaying any journalled updates
+    
+    Parameters
+    ----------
+    run_path : str
+        Path to run catalogue json file
+    
+    Returns
+    -------
+    run_cat : dict
+        Run catalogue organised by norad id
+    """
+    with open(run_path, 'r') as rc:
+        run_cat = json.load(rc)
+    
+    update_path = getUpdatePath(run_path)
+    if os.path.exists(update_path):
+        with open(update_path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    elsets = json.loads(line)
+                except ValueError:
+                    print('Skipping malformed journal line: {}'.format(
+                        line[:80]))
+                    continue
+                insertElsets(run_cat, elsets)
+    
+    return run_cat
+
+def compactCat(run_cat, out_dir):
+    """
+    Rewrite run_cat.json in full, folding in the update journal
+    
+    Parameters
+    ----------
+    run_cat : dict
+        Run catalogue organised by norad id, as loaded by loadRunCat
+    out_dir : str
+        Directory containing the run catalogue
+    
+    Returns
+    -------
+    None
+    """
+    with open(out_dir + RUN_CAT_FILE + '.tmp', 'w') as f:
+        json.dump(run_cat, f)
+    os.replace(out_dir + RUN_CAT_FILE + '.tmp', out_dir + RUN_CAT_FILE)
+    
+    if os.path.exists(getUpdatePath(out_dir + RUN_CAT_FILE)):
+        os.remove(getUpdatePath(out_dir + RUN_CAT_FILE))
+    
+    return None
+
 def getFractionalYearDay(epoch):
     """
     Convert a datetime object to day of the year with frational 
@@ -453,17 +820,20 @@ def getEpochCat(run_cat, epoch, out_dir=None):
         Catalogue of tles for desired epoch
     """
     epoch_yday = getFractionalYearDay(epoch)
-    
-    epoch_cat = {}
-    for n, norad_id in enumerate(run_cat.keys()):
-        print('Processing {}/{}'.format(str(n),
-                                        str(len(run_cat.keys()))), end="\r")
-        t_diff = []
-        for tle in run_cat[norad_id]:
-            t = TLE(tle[0], tle[1])
-            t_diff.append(abs(epoch_yday - t.yday))
-        min_idx = min(enumerate(t_diff), key=itemgetter(1))[0]
-        epoch_cat.update({norad_id:run_cat[norad_id][min_idx]})
+    progress = Progress(len(run_cat))
+    
+    with stage('epoch'):
+        epoch_cat = {}
+        for n, norad_id in enumerate(run_cat.keys()):
+            progress.update(n)
+            t_diff = []
+            for tle in run_cat[norad_id]:
+                t = TLE(tle[0], tle[1])
+                t_diff.append(abs(epoch_yday - t.yday))
+            min_idx = min(enumerate(t_diff), key=itemgetter(1))[0]
+            epoch_cat.update({norad_id:run_cat[norad_id][min_idx]})
+    count('epoch', len(run_cat))
+    progress.done()
     
     if out_dir is not None:
         with open(out_dir + 'epoch_cat.json', 'w') as f:
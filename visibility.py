@@ -0,0 +1,328 @@
+"""
+Cheap visibility pre-filter, pruning objects that cannot be observed
+
+Uses only the mean elements, the site and a low-precision Sun, so a whole
+catalogue can be pruned once per night before any full propagation. The
+checks are conservative: an object is only pruned if it certainly cannot
+be above the horizon, sunlit and inside the requested Dec range at any of
+the given times.
+"""
+
+import math
+from datetime import datetime
+from tle import (
+    TLE,
+    getElsetEpoch,
+    )
+
+EARTH_RADIUS = 6378.135  # km, WGS72 as used by SGP4
+SHADOW_RADIUS = EARTH_RADIUS * 0.99 # allow for penumbra
+MU = 398600.8            # km^3 s^-2, WGS72
+J2 = 0.001082616         # WGS72
+SIDEREAL_RATE = 1.00273790935 # rev/day
+
+J2000 = datetime(2000, 1, 1, 12)
+
+GEO_MM_LIM = (0.9, 1.1)  # mean motion [rev/day] for longitude slot check
+GEO_E_LIM = 0.1
+SLOT_MARGIN = 2.         # deg, plus eccentricity and drift terms below
+DRIFT_MARGIN = 0.1       # deg/day from the elset epoch
+SUN_MARGIN = 1.          # deg, on the Earth's shadow
+PLANE_MARGIN = 1.        # deg, on the orbital plane, plus drift below
+NODE_MARGIN = 0.05       # deg/day from the elset epoch
+PRECESSION = 0.0056      # deg/yr, Dec change of the equator from J2000
+NUTATION = 0.003         # deg
+CHUNK = 10000            # objects per block of the (objects x times) checks
+
+def getJulianDate(epoch):
+    """
+    Convert a (utc) datetime object to julian date
+    """
+    epoch = epoch.replace(tzinfo=None)
+    
+    return 2451545. + (epoch - J2000).total_seconds() / 86400.
+
+def getGMST(jd):
+    """
+    Greenwich mean sidereal time [deg] for julian date(s)
+    """
+    return (280.46061837 + 360.98564736629 * (jd - 2451545.)) % 360.
+
+def getSunRADec(jd):
+    """
+    Low-precision (~0.01 deg) solar RA and Dec [deg] for julian date(s)
+    """
+    import numpy as np
+    
+    n = jd - 2451545.
+    L = 280.460 + 0.9856474 * n
+    g = np.radians(357.528 + 0.9856003 * n)
+    lam = np.radians(L + 1.915 * np.sin(g) + 0.020 * np.sin(2 * g))
+    eps = np.radians(23.439 - 0.0000004 * n)
+    
+    ra = np.degrees(np.arctan2(np.cos(eps) * np.sin(lam), np.cos(lam)))
+    dec = np.degrees(np.arcsin(np.sin(eps) * np.sin(lam)))
+    
+    return ra, dec
+
+def getUnitVector(ra, dec):
+    """
+    Unit vector(s) for RA and Dec [deg], stacked along the last axis
+    """
+    import numpy as np
+    
+    ra, dec = np.broadcast_arrays(np.radians(ra), np.radians(dec))
+    
+    return np.stack([np.cos(dec) * np.cos(ra),
+                     np.cos(dec) * np.sin(ra),
+                     np.sin(dec)], axis=-1)
+
+def getElsetJulianDate(line1):
+    """
+    Julian date of the epoch of a tle
+    """
+    epoch = getElsetEpoch(line1)
+    year = int(epoch // 1000)
+    
+    return getJulianDate(datetime(year, 1, 1)) + (epoch - year * 1000) - 1.
+
+def getArc(pole, node, vec, radius):
+    """
+    Arc of an orbital plane within an angular radius of a direction
+    
+    Parameters
+    ----------
+    pole, node : array-like
+        Unit vectors of the orbit normal and ascending node, (..., 3)
+    vec : array-like
+        Unit vector(s) of the direction, (..., 3)
+    radius : array-like
+        Angular radius [deg]
+    
+    Returns
+    -------
+    centre, width : array-like
+        Argument of latitude [deg] at the middle of the arc, and its 
+        half-width [deg]; width is NaN where the plane does not come
+        within the radius
+    """
+    import numpy as np
+    
+    along = np.cross(pole, node)
+    centre = np.degrees(np.arctan2(np.sum(vec * along, axis=-1),
+                                   np.sum(vec * node, axis=-1)))
+    cos_off = np.sqrt(np.clip(1. - np.sum(vec * pole, axis=-1)**2, 
+                              0., 1.))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.cos(np.radians(radius)) / cos_off
+    width = np.where(ratio <= 1., 
+                     np.degrees(np.arccos(np.clip(ratio, -1., 1.))),
+                     np.nan)
+    
+    return centre, width
+
+def getHorizonAngle(radius, min_alt=0.):
+    """
+    Earth-central angle [deg] from the site within which an object at a
+    given geocentric radius is above a minimum altitude
+    
+    Parameters
+    ----------
+    radius : array-like
+        Geocentric radius [km]
+    min_alt : float, optional
+        Minimum altitude [deg]
+        Default = 0.
+    
+    Returns
+    -------
+    angle : array-like
+        Maximum central angle [deg]
+    """
+    import numpy as np
+    
+    min_alt = math.radians(min_alt)
+    ratio = np.clip(EARTH_RADIUS * math.cos(min_alt) / radius, -1., 1.)
+    
+    return np.degrees(np.arccos(ratio) - min_alt)
+
+def preFilter(cat, times, lat, lon, min_alt=0., dec_range=None):
+    """
+    Prune a catalogue of objects that cannot be observed at any of the
+    given times
+    
+    Five checks are made, each from the mean elements alone:
+        dec      - Dec range unreachable given inclination and parallax
+        latitude - sub-satellite track never within sight of the site
+        slot     - GEO longitude slot below the horizon at every time
+        plane    - orbital plane (with J2 nodal drift) never passes 
+                   within sight of the site
+        shadow   - every part of the orbit within sight is in the 
+                   Earth's shadow, at every time
+    
+    The plane and shadow checks do the pruning for LEO, but as only 
+    the orbit (not the phase) is known, an object is kept if it could 
+    be in sight and sunlit at any one of the times. Over a whole night 
+    most LEO objects genuinely are, so expect a modest cut for LEO 
+    and a larger one for short windows or GEO-heavy catalogues.
+    
+    Parameters
+    ----------
+    cat : dict
+        Catalogue of tles, keyed by norad id, e.g. epoch_cat.json
+    times : array-like
+        List of datetime objects (utc) at which objects are wanted
+    lat, lon : float
+        Site latitude and (east) longitude [deg]
+    min_alt : float, optional
+        Minimum useful altitude [deg]
+        Default = 0.
+    dec_range : tuple, optional
+        (min, max) Dec [deg] of interest, e.g. the plotted range
+        Default = None
+    
+    Returns
+    -------
+    kept : dict
+        Catalogue of objects that may be observable
+    pruned : dict
+        Number of objects pruned by each check
+    """
+    import numpy as np
+    
+    norad_ids = list(cat.keys())
+    tles = [TLE(cat[norad_id][0], cat[norad_id][1])
+            for norad_id in norad_ids]
+    
+    inc = np.radians([t.inclination for t in tles])
+    e = np.array([t.eccentricity for t in tles]) * 1e-7
+    mm = np.array([t.mean_motion for t in tles])
+    raan = np.array([t.raan for t in tles])
+    
+    jd = np.array([getJulianDate(t) for t in times])
+    epoch_jd = np.array([getElsetJulianDate(t.line1) for t in tles])
+    
+    # apogee and perigee radii from the mean motion
+    a = (MU / (mm * 2. * math.pi / 86400.)**2)**(1. / 3.)
+    r_p = a * (1. - e)
+    r_a = a * (1. + e)
+    horizon = getHorizonAngle(r_a, min_alt)
+    
+    # greatest latitude/Dec reached by the sub-satellite point
+    i_max = np.degrees(np.where(inc > math.pi / 2., math.pi - inc, inc))
+    
+    keep = np.ones(len(tles), dtype=bool)
+    pruned = {'dec':0, 'latitude':0, 'slot':0, 'plane':0, 'shadow':0}
+    
+    # dec: topocentric Dec can exceed the inclination only by parallax,
+    # plus the tilt between the equator of date and that of ICRS
+    if dec_range is not None:
+        parallax = np.degrees(np.arcsin(np.clip(EARTH_RADIUS / r_p,
+                                                0., 1.)))
+        years = np.max(abs(jd - 2451545.)) / 365.25
+        dec_lim = i_max + parallax + PRECESSION * years + NUTATION
+        reach = (dec_lim >= dec_range[0]) & (-dec_lim <= dec_range[1])
+        pruned['dec'] = int(np.sum(keep & ~reach))
+        keep &= reach
+    
+    # latitude: nearest sub-satellite point vs horizon reach at apogee
+    reach = abs(lat) - i_max <= horizon + PLANE_MARGIN
+    pruned['latitude'] = int(np.sum(keep & ~reach))
+    keep &= reach
+    
+    # slot: GEO sub-satellite longitude within sight, per time
+    visible = np.ones((len(tles), len(jd)), dtype=bool)
+    geo = (mm > GEO_MM_LIM[0]) & (mm < GEO_MM_LIM[1]) & (e < GEO_E_LIM)
+    for n in np.nonzero(geo & keep)[0]:
+        tle = tles[n]
+        
+        # sub-satellite longitude at epoch, then linear drift
+        M = math.radians(tle.mean_anomaly)
+        u = math.radians(tle.argperigree) + M + 2 * e[n] * math.sin(M)
+        ra = tle.raan + math.degrees(math.atan2(math.cos(inc[n]) *
+                                                math.sin(u),
+                                                math.cos(u)))
+        sub_lon = (ra - getGMST(epoch_jd[n]) +
+                   (mm[n] - SIDEREAL_RATE) * 360. * (jd - epoch_jd[n]))
+        
+        margin = (SLOT_MARGIN + math.degrees(2 * e[n]) +
+                  DRIFT_MARGIN * abs(jd - epoch_jd[n]))
+        d_lon = abs((sub_lon - lon + 180.) % 360. - 180.) - margin
+        d_lon = np.radians(np.clip(d_lon, 0., 180.))
+        
+        # central angle to the nearest sub-satellite point on that
+        # meridian, with latitude limited to +/- inclination
+        phi = math.radians(lat)
+        i_lim = math.radians(i_max[n])
+        phi_0 = np.arctan2(math.sin(phi), math.cos(phi) * np.cos(d_lon))
+        cos_c = None
+        for phi_sat in [np.clip(phi_0, -i_lim, i_lim), -i_lim, i_lim]:
+            cos_sat = (math.sin(phi) * np.sin(phi_sat) +
+                       math.cos(phi) * np.cos(phi_sat) * np.cos(d_lon))
+            cos_c = cos_sat if cos_c is None else np.maximum(cos_c, 
+                                                             cos_sat)
+        central = np.degrees(np.arccos(np.clip(cos_c, -1., 1.)))
+        visible[n] = central <= horizon[n]
+    
+    in_slot = np.any(visible, axis=1)
+    pruned['slot'] = int(np.sum(keep & ~in_slot))
+    keep &= in_slot
+    
+    # plane and shadow, in the equator and equinox of date: the arc of
+    # each orbit within sight of the site, at apogee height, per time
+    site = getUnitVector(getGMST(jd) + lon, lat)
+    anti_sun = -getUnitVector(*getSunRADec(jd))
+    shadow = np.degrees(np.arcsin(SHADOW_RADIUS / r_a))
+    node_rate = (-1.5 * J2 * (EARTH_RADIUS / (a * (1. - e**2)))**2 *
+                 np.cos(inc) * mm * 360.)
+    
+    near = np.zeros(visible.shape, dtype=bool)
+    lit = np.zeros(visible.shape, dtype=bool)
+    for c in range(0, len(tles), CHUNK):
+        block = slice(c, c + CHUNK)
+        d_t = jd[None, :] - epoch_jd[block, None]
+        node = np.radians(raan[block, None] + node_rate[block, None] * d_t)
+        sin_i = np.sin(inc[block, None]) * np.ones(node.shape)
+        cos_i = np.cos(inc[block, None]) * np.ones(node.shape)
+        node_vec = np.stack([np.cos(node), 
+                             np.sin(node), 
+                             np.zeros(node.shape)], axis=-1)
+        pole_vec = np.stack([sin_i * np.sin(node), 
+                             -sin_i * np.cos(node), 
+                             cos_i], axis=-1)
+        
+        margin = PLANE_MARGIN + NODE_MARGIN * abs(d_t)
+        centre, width = getArc(pole_vec, node_vec, site[None],
+                               horizon[block, None] + margin)
+        dark_centre, dark_width = getArc(pole_vec, node_vec, anti_sun[None],
+                                         shadow[block, None] - SUN_MARGIN)
+        
+        # sunlit unless the arc in sight lies wholly within the shadow
+        offset = abs((centre - dark_centre + 180.) % 360. - 180.)
+        with np.errstate(invalid='ignore'):
+            dark = offset + width <= dark_width
+        near[block] = ~np.isnan(width)
+        lit[block] = near[block] & ~dark
+    
+    in_plane = np.any(visible & near, axis=1)
+    pruned['plane'] = int(np.sum(keep & ~in_plane))
+    keep &= in_plane
+    
+    observable = np.any(visible & lit, axis=1)
+    pruned['shadow'] = int(np.sum(keep & ~observable))
+    keep &= observable
+    
+    kept = {norad_id:cat[norad_id]
+            for norad_id, k in zip(norad_ids, keep) if k}
+    
+    print('Number of objects pruned: {}/{} '
+          '(dec {}, latitude {}, slot {}, plane {}, shadow {})'.format(
+              str(len(cat) - len(kept)),
+              str(len(cat)),
+              str(pruned['dec']),
+              str(pruned['latitude']),
+              str(pruned['slot']),
+              str(pruned['plane']),
+              str(pruned['shadow'])))
+    
+    return kept, pruned